@@ -1,12 +1,544 @@
+import io
+import logging
+import mmap
+import os
 import sys
 import argparse
-from pypdf import PdfReader, PdfWriter, Transformation
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import islice
+from pypdf import PageObject, PdfReader, PdfWriter, Transformation
+from pypdf.generic import (ArrayObject, DecodedStreamObject, DictionaryObject, EncodedStreamObject, FloatObject,
+                           IndirectObject, NameObject, NullObject, NumberObject, RectangleObject, StreamObject)
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; compute_layouts falls back to compute_layout per page
+    np = None
+
+try:
+    from pypdf.generic._appearance_stream import transform_annotation_appearance
+except ImportError:  # older pypdf: annotation appearances are left as they are, like its merge_transformed_page did
+    transform_annotation_appearance = None
+
+try:
+    from tqdm import tqdm
+except ImportError:  # tqdm is optional; without it there is no progress bar
+    tqdm = None
 
 # A4 dimensions in points (1 point = 1/72 inch)
 A4_LANDSCAPE_WIDTH = 841.890
 A4_LANDSCAPE_HEIGHT = 595.276
 
-def create_pdf(input_path: str, output_path: str, crop_settings: dict, x_offset: float, y_offset: float):
+# Left edge of the left and right half of the sheet, indexed by the page's position in its pair
+SHEET_ANCHORS = (0.0, A4_LANDSCAPE_WIDTH / 2)
+
+# Inputs above this size are memory-mapped instead of read into a buffer
+MMAP_THRESHOLD = 64 * 1024 * 1024
+
+# Number of small objects packed into each compressed object stream of the pypdf output
+OBJECT_STREAM_SIZE = 100
+
+# JPEG quality of the sheets produced by --raster-dpi
+RASTER_JPEG_QUALITY = 90
+
+@contextmanager
+def partial_output(output_path: str):
+    """
+    Opens a temporary file next to output_path for a streamed write, and moves
+    it into place only once the block completes.
+
+    If anything fails part-way the temporary file is removed, so a truncated
+    PDF is never left under the output name.
+    """
+    partial_path = output_path + ".tmp"
+    try:
+        with open(partial_path, "wb") as f:
+            yield f
+        os.replace(partial_path, output_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+
+def quiet_pypdf():
+    """Drops pypdf's per-object recovery warnings so malformed inputs don't flood the loop with log records."""
+    logging.getLogger("pypdf").setLevel(logging.ERROR)
+
+def progress(iterable, desc: str, total: int | None = None):
+    """Wraps iterable in a single-line tqdm progress bar, when tqdm is installed."""
+    if tqdm is None:
+        return iterable
+    return tqdm(iterable, desc=desc, total=total)
+
+def open_source(input_path: str) -> PdfReader:
+    """
+    Opens the source PDF from memory rather than from its path.
+
+    pypdf seeks back into the file for every indirect object it resolves, so
+    the whole file is slurped (or mapped, for large files) up front and those
+    seeks become memory reads instead of syscalls.
+    """
+    with open(input_path, "rb") as fh:
+        if os.fstat(fh.fileno()).st_size > MMAP_THRESHOLD:
+            # The mapping stays valid after the file is closed; the OS page cache handles residency
+            return PdfReader(mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ))
+        return PdfReader(io.BytesIO(fh.read()))
+
+class StreamingPdfWriter:
+    """
+    Writes the objects of a PdfWriter to disk as soon as each sheet is finished.
+
+    Flushed objects are swapped for their bare IndirectObject in the writer, and
+    written sheets are dropped from its page list. Memory still grows with the
+    output, but only by the per-object bookkeeping (that reference, the xref
+    entry and pypdf's clone map), under a kilobyte per page, instead of by the
+    objects themselves.
+    The catalog, page tree and info dictionary keep changing until the last
+    sheet, so they are written by close() together with the cross-reference
+    data.
+
+    With object_streams, every object that is not itself a stream (page and
+    resource dictionaries, arrays, ...) is packed into compressed PDF 1.5
+    object streams of OBJECT_STREAM_SIZE objects, and the cross-reference
+    table becomes an xref stream.
+    """
+
+    def __init__(self, writer: PdfWriter, stream, object_streams: bool = True):
+        self.writer = writer
+        self.stream = stream
+        self.object_streams = object_streams
+        self.xref_offsets: list[int] = []
+        # idnum -> (idnum of the object stream holding it, index within that stream)
+        self._compressed: dict[int, tuple[int, int]] = {}
+        self._pending: list[tuple[int, bytes]] = []
+        self._flushed_pages = 0
+        self._deferred = {writer.root_object.indirect_reference.idnum, writer._pages.idnum}
+        if writer._info is not None:
+            self._deferred.add(writer._info.indirect_reference.idnum)
+        stream.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+
+    def _allocate_idnum(self) -> int:
+        # Reserve the number in the writer so later objects never collide with it
+        ref = self.writer._add_object(NullObject())
+        self.xref_offsets.extend([0] * (len(self.writer._objects) - len(self.xref_offsets)))
+        return ref.idnum
+
+    def _write_object(self, idnum: int, obj):
+        self.xref_offsets[idnum - 1] = self.stream.tell()
+        self.stream.write(f"{idnum} 0 obj\n".encode())
+        obj.write_to_stream(self.stream)
+        self.stream.write(b"\nendobj\n")
+
+    def _emit(self, idnum: int, obj):
+        if not self.object_streams or isinstance(obj, StreamObject):
+            self._write_object(idnum, obj)
+            return
+        buffer = io.BytesIO()
+        obj.write_to_stream(buffer)
+        self._pending.append((idnum, buffer.getvalue()))
+        if len(self._pending) >= OBJECT_STREAM_SIZE:
+            self._write_object_stream()
+
+    def _write_object_stream(self):
+        if not self._pending:
+            return
+        offsets, body = [], io.BytesIO()
+        for idnum, data in self._pending:
+            offsets.append(f"{idnum} {body.tell()}")
+            body.write(data + b"\n")
+        header = " ".join(offsets).encode() + b"\n"
+
+        object_stream = DecodedStreamObject()
+        object_stream.set_data(header + body.getvalue())
+        object_stream = object_stream.flate_encode()
+        object_stream[NameObject("/Type")] = NameObject("/ObjStm")
+        object_stream[NameObject("/N")] = NumberObject(len(self._pending))
+        object_stream[NameObject("/First")] = NumberObject(len(header))
+
+        stream_idnum = self._allocate_idnum()
+        self._write_object(stream_idnum, object_stream)
+        for index, (idnum, _) in enumerate(self._pending):
+            self._compressed[idnum] = (stream_idnum, index)
+        self._pending = []
+
+    def flush(self):
+        """Writes every object added since the last flush, except the deferred ones."""
+        objects = self.writer._objects
+        first_new = len(self.xref_offsets)
+        last_new = len(objects)
+        self.xref_offsets.extend([0] * (last_new - first_new))
+        for idnum in range(first_new + 1, last_new + 1):
+            obj = objects[idnum - 1]
+            if obj is None or idnum in self._deferred:
+                continue
+            self._emit(idnum, obj)
+            # Leave the bare reference (its own indirect_reference) so later clones of shared resources still
+            # resolve to this idnum
+            objects[idnum - 1] = IndirectObject(idnum, 0, self.writer)
+
+        # The writer's page list would keep every written sheet alive too; it only needs their count
+        pages = self.writer.flattened_pages
+        for index in range(self._flushed_pages, len(pages)):
+            pages[index] = pages[index].indirect_reference
+        self._flushed_pages = len(pages)
+
+    def _trailer_entries(self) -> DictionaryObject:
+        entries = DictionaryObject({
+            NameObject("/Size"): NumberObject(len(self.xref_offsets) + 1),
+            NameObject("/Root"): self.writer.root_object.indirect_reference,
+        })
+        if self.writer._info is not None:
+            entries[NameObject("/Info")] = self.writer._info.indirect_reference
+        return entries
+
+    def _write_xref_table(self):
+        xref_location = self.stream.tell()
+        self.stream.write(b"xref\n")
+        self.stream.write(f"0 {len(self.xref_offsets) + 1}\n".encode())
+        self.stream.write(b"0000000000 65535 f \n")
+        for offset in self.xref_offsets:
+            if offset:
+                self.stream.write(f"{offset:0>10} 00000 n \n".encode())
+            else:
+                self.stream.write(b"0000000000 65535 f \n")
+
+        self.stream.write(b"trailer\n")
+        self._trailer_entries().write_to_stream(self.stream)
+        self.stream.write(f"\nstartxref\n{xref_location}\n%%EOF\n".encode())
+
+    def _write_xref_stream(self):
+        xref_idnum = self._allocate_idnum()
+        xref_location = self.stream.tell()
+        self.xref_offsets[xref_idnum - 1] = xref_location
+
+        # One (type, field 2, field 3) row per object: 0 = free, 1 = at offset, 2 = inside an object stream
+        rows = [(0, 0, 65535)]
+        for idnum, offset in enumerate(self.xref_offsets, start=1):
+            if idnum in self._compressed:
+                rows.append((2, *self._compressed[idnum]))
+            elif offset:
+                rows.append((1, offset, 0))
+            else:
+                rows.append((0, 0, 65535))
+        field2_width = max(1, (max(row[1] for row in rows).bit_length() + 7) // 8)
+
+        xref_stream = DecodedStreamObject()
+        xref_stream.set_data(b"".join(
+            kind.to_bytes(1, "big") + field2.to_bytes(field2_width, "big") + field3.to_bytes(2, "big")
+            for kind, field2, field3 in rows))
+        xref_stream = xref_stream.flate_encode()
+        xref_stream.update(self._trailer_entries())
+        xref_stream[NameObject("/Type")] = NameObject("/XRef")
+        xref_stream[NameObject("/W")] = ArrayObject([NumberObject(1), NumberObject(field2_width), NumberObject(2)])
+
+        self._write_object(xref_idnum, xref_stream)
+        self.stream.write(f"startxref\n{xref_location}\n%%EOF\n".encode())
+
+    def close(self):
+        """Writes the deferred objects and the cross-reference data."""
+        self.flush()
+        for idnum in sorted(self._deferred):
+            self._emit(idnum, self.writer._objects[idnum - 1])
+
+        if self.object_streams:
+            self._write_object_stream()
+            self._write_xref_stream()
+        else:
+            self._write_xref_table()
+
+@lru_cache(maxsize=8)
+def compute_layout(original_w: float, original_h: float, crop_t: float, crop_b: float, crop_l: float, crop_r: float,
+                   x_offset: float, y_offset: float) -> tuple[float, float, float, float, float, float, float]:
+    """
+    Computes the crop box and placement of a source page on its half of the sheet.
+
+    Most documents use a single page size, so the result is cached by geometry
+    and reused for every page instead of being recomputed per page.
+
+    Args:
+        original_w: Width of the source page in points.
+        original_h: Height of the source page in points.
+        crop_t, crop_b, crop_l, crop_r: Crop percentages for top, bottom, left, right.
+        x_offset: Manual horizontal shift in points.
+        y_offset: Manual vertical shift in points.
+
+    Returns:
+        (crop_left, crop_bottom, crop_right_edge, crop_top_edge, scale, tx, ty),
+        where the first four are the crop box in source coordinates and the
+        rest the scale and translation within a half sheet; the half's own
+        position is added from SHEET_ANCHORS.
+    """
+    target_width_per_page = A4_LANDSCAPE_WIDTH / 2
+    target_height_per_page = A4_LANDSCAPE_HEIGHT
+
+    # --- NEW: Per-Edge Cropping Logic ---
+    crop_top = original_h * (crop_t / 100.0)
+    crop_bottom = original_h * (crop_b / 100.0)
+    crop_left = original_w * (crop_l / 100.0)
+    crop_right = original_w * (crop_r / 100.0)
+    crop_right_edge = original_w - crop_right
+    crop_top_edge = original_h - crop_top
+
+    # Scale and place using cropped dimensions
+    cropped_w = crop_right_edge - crop_left
+    cropped_h = crop_top_edge - crop_bottom
+    scale = min(target_width_per_page / cropped_w, target_height_per_page / cropped_h)
+    scaled_w, scaled_h = cropped_w * scale, cropped_h * scale
+
+    # Calculate centered position + manual offset
+    ty = (target_height_per_page - scaled_h) / 2 + y_offset
+    tx = (target_width_per_page - scaled_w) / 2 + x_offset
+
+    return crop_left, crop_bottom, crop_right_edge, crop_top_edge, scale, tx, ty
+
+def page_sizes(pages: list[PageObject]) -> list[tuple[float, float]]:
+    """Returns (width, height) for every page, resolving each media box once."""
+    sizes = []
+    for page in pages:
+        mb = page.mediabox
+        sizes.append((float(mb.right) - float(mb.left), float(mb.top) - float(mb.bottom)))
+    return sizes
+
+def compute_layouts(sizes: list[tuple[float, float]], crop_settings: dict, x_offset: float, y_offset: float) -> list[tuple]:
+    """
+    Computes the compute_layout tuple for every page at once.
+
+    With numpy the arithmetic for the whole document runs as a handful of
+    array operations, which matters for long documents of mixed page sizes;
+    without it each size goes through the cached scalar helper.
+    """
+    crop_t, crop_b, crop_l, crop_r = (crop_settings[edge] for edge in ('top', 'bottom', 'left', 'right'))
+    if np is None or not sizes:
+        return [compute_layout(w, h, crop_t, crop_b, crop_l, crop_r, x_offset, y_offset) for w, h in sizes]
+
+    target_width_per_page = A4_LANDSCAPE_WIDTH / 2
+    target_height_per_page = A4_LANDSCAPE_HEIGHT
+
+    dims = np.asarray(sizes, dtype=float)
+    original_w, original_h = dims[:, 0], dims[:, 1]
+    crop_left = original_w * (crop_l / 100.0)
+    crop_bottom = original_h * (crop_b / 100.0)
+    crop_right_edge = original_w - original_w * (crop_r / 100.0)
+    crop_top_edge = original_h - original_h * (crop_t / 100.0)
+
+    cropped_w = crop_right_edge - crop_left
+    cropped_h = crop_top_edge - crop_bottom
+    scale = np.minimum(target_width_per_page / cropped_w, target_height_per_page / cropped_h)
+
+    ty = (target_height_per_page - cropped_h * scale) / 2 + y_offset
+    tx = (target_width_per_page - cropped_w * scale) / 2 + x_offset
+
+    layouts = np.column_stack((crop_left, crop_bottom, crop_right_edge, crop_top_edge, scale, tx, ty))
+    return [tuple(row) for row in layouts.tolist()]
+
+def page_to_xobject(writer: PdfWriter, page, bbox: tuple[float, float, float, float]) -> IndirectObject:
+    """
+    Wraps a source page as a Form XObject in writer, clipped to bbox.
+
+    A single content stream is reused as-is, still encoded, so it is neither
+    tokenized nor recompressed; only the page's resources are cloned.
+    """
+    contents = page.get("/Contents")
+    if isinstance(contents, ArrayObject) and len(contents) == 1:
+        contents = contents[0].get_object()
+
+    if isinstance(contents, StreamObject):
+        xobject = EncodedStreamObject() if "/Filter" in contents else DecodedStreamObject()
+        xobject._data = contents._data
+        for key in ("/Filter", "/DecodeParms"):
+            if key in contents:
+                xobject[NameObject(key)] = contents[key].clone(writer)
+    else:
+        # Several (or no) content streams: they only form a valid program once joined
+        xobject = DecodedStreamObject()
+        # Left uncompressed here; compress_output() deflates everything in one pass if requested
+        xobject.set_data(b"\n".join(stream.get_object().get_data() for stream in contents or ()))
+
+    xobject[NameObject("/Type")] = NameObject("/XObject")
+    xobject[NameObject("/Subtype")] = NameObject("/Form")
+    xobject[NameObject("/BBox")] = RectangleObject(bbox)
+    resources = page.raw_get("/Resources") if "/Resources" in page else None
+    xobject[NameObject("/Resources")] = resources.clone(writer) if resources is not None else DictionaryObject()
+    return writer._add_object(xobject)
+
+# Fields not carried over when an annotation is copied onto a sheet (as in pypdf's page merging). In-document
+# destinations are dropped too: they point at source pages, which are not part of the output.
+ANNOTATION_IGNORED_FIELDS = ("/P", "/StructParent", "/Parent", "/Dest", "/A")
+
+def import_annotations(writer: PdfWriter, page, layout: tuple, anchor: float) -> list[IndirectObject]:
+    """
+    Copies a source page's annotations into writer, moved to where the page
+    lands on its sheet.
+
+    Each annotation gets the same scale-then-translate as its page, as
+    merge_transformed_page does. Annotations lying entirely in the
+    cropped-away margins are skipped, and so are links into the document
+    itself, which would be left without a target.
+    """
+    annots = page["/Annots"] if "/Annots" in page else None
+    if not isinstance(annots, ArrayObject):
+        return []
+
+    crop_left, crop_bottom, crop_right_edge, crop_top_edge, scale, tx, ty = layout
+    transform = Transformation((scale, 0, 0, scale, tx + anchor, ty))
+    refs = []
+    for annot in annots:
+        annot = annot.get_object()
+        if not isinstance(annot, DictionaryObject) or "/Rect" not in annot:
+            continue
+        x1, y1, x2, y2 = (float(v) for v in annot["/Rect"])
+        if max(x1, x2) < crop_left or min(x1, x2) > crop_right_edge or max(y1, y2) < crop_bottom or min(y1, y2) > crop_top_edge:
+            continue
+        action = annot["/A"] if "/A" in annot else None
+        goes_to = isinstance(action, DictionaryObject) and action.get("/S") == "/GoTo"
+        if annot.get("/Subtype") == "/Link" and ("/Dest" in annot or goes_to):
+            continue
+
+        copy = annot.clone(writer, ignore_fields=ANNOTATION_IGNORED_FIELDS, force_duplicate=True)
+        if isinstance(action, DictionaryObject) and not goes_to:
+            copy[NameObject("/A")] = annot.raw_get("/A").clone(writer)
+
+        (x1, y1), (x2, y2) = transform.apply_on((x1, y1)), transform.apply_on((x2, y2))
+        copy[NameObject("/Rect")] = RectangleObject((min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)))
+        if "/QuadPoints" in annot:
+            quad_points = [float(v) for v in annot["/QuadPoints"]]
+            copy[NameObject("/QuadPoints")] = ArrayObject(
+                FloatObject(v) for i in range(0, len(quad_points) - 1, 2)
+                for v in transform.apply_on((quad_points[i], quad_points[i + 1])))
+        if transform_annotation_appearance is not None:
+            transform_annotation_appearance(copy, transform)
+        if "/Popup" in copy:
+            copy["/Popup"][NameObject("/Parent")] = copy.indirect_reference
+        # /P (the annotation's page) is optional and left out: the sheet it lands on is only created once every
+        # page is imported, and the annotation has been written out by then
+        refs.append(copy.indirect_reference)
+    return refs
+
+# Every sheet starts from this bare page; its size is inherited from the page tree (see new_sheet_writer)
+SHEET_TEMPLATE = PageObject()
+SHEET_TEMPLATE[NameObject("/Type")] = NameObject("/Page")
+
+def new_sheet_writer() -> PdfWriter:
+    """
+    Returns a PdfWriter whose page tree carries the A4 landscape media box.
+
+    The media box is inherited by every sheet, so it is written once instead
+    of once per sheet.
+    """
+    writer = PdfWriter()
+    writer._pages.get_object()[NameObject("/MediaBox")] = RectangleObject((0, 0, A4_LANDSCAPE_WIDTH, A4_LANDSCAPE_HEIGHT))
+    return writer
+
+def import_pages(writer: PdfWriter, pages, layouts: list[tuple], on_page=None) -> tuple[list, list]:
+    """
+    Imports source pages into writer as Form XObjects cropped to their layouts,
+    in one pass ahead of sheet composition.
+
+    on_page, if given, is called with each page after it is imported (used to
+    stream the new objects to disk and release the page as it goes).
+
+    Returns:
+        The XObject of each page, and the list of its annotations' copies.
+    """
+    xobjects, annotations = [], []
+    for page_index, (page, layout) in enumerate(zip(pages, layouts)):
+        # The XObject's BBox does the cropping; the reader's page is never modified
+        xobjects.append(page_to_xobject(writer, page, layout[:4]))
+        annotations.append(import_annotations(writer, page, layout, SHEET_ANCHORS[page_index % 2]))
+        if on_page is not None:
+            on_page(page)
+    return xobjects, annotations
+
+def release_page(page: PageObject, kept: int = 0) -> int:
+    """
+    Evicts what importing a page parsed from its reader's object cache.
+
+    Once a page has been imported (and its objects written out) none of it is
+    read again: resources shared with later pages, such as fonts, are found
+    through the writer's clone map, which does not resolve the source object a
+    second time. Without this the reader would keep every parsed object of the
+    document alive. Objects packed in object streams stay cached: pypdf parses
+    a whole object stream at once, so evicting one of them would mean parsing
+    its stream again for the next.
+
+    kept is the value returned by the previous call for the same reader: the
+    cache entries it left, which are skipped so each call only looks at what
+    was added since.
+    """
+    reader = page.pdf
+    cache = reader.resolved_objects
+    # Entries are appended in insertion order, so the new ones are the last len(cache) - kept
+    for key in list(islice(reversed(cache), len(cache) - kept)):
+        if key[1] not in reader.xref_objStm:
+            del cache[key]
+    return len(cache)
+
+def compose_sheet(writer: PdfWriter, pair_xobjects: list[IndirectObject], pair_layouts: list[tuple],
+                  pair_annotations: list[list[IndirectObject]] = ()):
+    """
+    Adds a sheet to writer placing up to two imported pages side-by-side.
+
+    The sheet's own content stream just places the pages' Form XObjects with
+    one cm/Do pair each. pair_layouts holds the compute_layout tuple of each
+    page in the pair, and pair_annotations the annotations import_pages
+    copied for them.
+    """
+    new_page = writer.add_page(SHEET_TEMPLATE)
+    xobjects = DictionaryObject()
+    operations = []
+
+    # Process up to two pages for the new sheet
+    for page_index_in_pair, (xobject, layout) in enumerate(zip(pair_xobjects, pair_layouts)):
+        scale, tx, ty = layout[4:]
+        name = f"/Fm{page_index_in_pair + 1}"
+        xobjects[NameObject(name)] = xobject
+
+        # Position left or right page with the fused scale-then-translate matrix
+        tx += SHEET_ANCHORS[page_index_in_pair]
+        operations.append(b"q %f 0 0 %f %f %f cm %s Do Q" % (scale, scale, tx, ty, name.encode()))
+
+    new_page[NameObject("/Resources")] = DictionaryObject({NameObject("/XObject"): xobjects})
+    content = DecodedStreamObject()
+    content.set_data(b"\n".join(operations))
+    new_page[NameObject("/Contents")] = writer._add_object(content)
+    annots = [ref for page_annots in pair_annotations for ref in page_annots]
+    if annots:
+        new_page[NameObject("/Annots")] = ArrayObject(annots)
+    return new_page
+
+def compress_output(output_path: str):
+    """
+    Deflates the streams the pypdf backend leaves uncompressed (the joined
+    content of pages with several content streams) in one pikepdf (QPDF)
+    pass over the finished file.
+
+    The object streams StreamingPdfWriter already packed are kept as they are,
+    and the result only replaces the file when it is actually smaller.
+    """
+    try:
+        import pikepdf
+    except ImportError:
+        print("Error: --compress requires pikepdf (pip install pikepdf).")
+        sys.exit(1)
+
+    compressed_path = output_path + ".compress"
+    try:
+        with pikepdf.open(output_path) as pdf:
+            pdf.save(compressed_path, compress_streams=True, object_stream_mode=pikepdf.ObjectStreamMode.preserve)
+    except pikepdf.PdfError as e:
+        if os.path.exists(compressed_path):
+            os.remove(compressed_path)
+        print(f"Error: Could not compress '{output_path}'.")
+        print(e)
+        sys.exit(1)
+    if os.path.getsize(compressed_path) < os.path.getsize(output_path):
+        os.replace(compressed_path, output_path)
+    else:
+        os.remove(compressed_path)
+
+def create_pdf(input_path: str, output_path: str, crop_settings: dict, x_offset: float, y_offset: float,
+               compress: bool = False):
     """
     Crops margins with individual per-edge control, creates a 2-up layout,
     and allows manual placement adjustments.
@@ -17,71 +549,299 @@ def create_pdf(input_path: str, output_path: str, crop_settings: dict, x_offset:
         crop_settings: A dictionary with crop percentages for top, bottom, left, right.
         x_offset: Manual horizontal shift in points.
         y_offset: Manual vertical shift in points.
+        compress: Deflate the finished file's uncompressed streams in a single pikepdf pass.
     """
+    quiet_pypdf()
     try:
-        reader = PdfReader(input_path)
+        reader = open_source(input_path)
     except FileNotFoundError:
         print(f"Error: The file '{input_path}' was not found.")
         sys.exit(1)
 
-    writer = PdfWriter()
-    num_pages = len(reader.pages)
+    writer = new_sheet_writer()
+    # Materialize the page list once; reader.pages[i] would walk the page tree on every lookup. This parses every
+    # page dict up front, the peak of the run; imported_pages() releases them again one by one
+    all_pages = list(reader.pages)
+    num_pages = len(all_pages)
     print(f"Processing {num_pages} pages with custom crop settings...")
     print(f"Crop settings: Top={crop_settings['top']}%, Bottom={crop_settings['bottom']}%, Left={crop_settings['left']}%, Right={crop_settings['right']}%")
 
-    target_width_per_page = A4_LANDSCAPE_WIDTH / 2
-    target_height_per_page = A4_LANDSCAPE_HEIGHT
+    # All crop and placement math is done up front; the loops below only build PDF objects
+    layouts = compute_layouts(page_sizes(all_pages), crop_settings, x_offset, y_offset)
+    pair_starts = range(0, num_pages, 2)
+    try:
+        with partial_output(output_path) as f:
+            output = StreamingPdfWriter(writer, f)
+            # Assemble then merge: import every page once, then emit the sheets in a tight loop
+            cache_kept = 0
+
+            def page_imported(page):
+                nonlocal cache_kept
+                output.flush()
+                cache_kept = release_page(page, cache_kept)
+
+            def imported_pages():
+                # Hand the pages over one at a time and drop them from both page lists, so each is freed once imported
+                for index in range(num_pages):
+                    page, all_pages[index] = all_pages[index], None
+                    reader.flattened_pages[index] = None
+                    yield page
+
+            xobjects, annotations = import_pages(writer, progress(imported_pages(), "Pages", total=num_pages), layouts,
+                                                 on_page=page_imported)
+            for i in pair_starts:
+                compose_sheet(writer, xobjects[i:i + 2], layouts[i:i + 2], annotations[i:i + 2])
+                output.flush()
+            output.close()
+        if compress:
+            compress_output(output_path)
+        print(f"✅ Success! Created '{output_path}' with {len(writer.pages)} pages.")
+    except OSError as e:
+        print(f"Error: Could not write to output file '{output_path}'.")
+        print(e)
+        sys.exit(1)
 
-    for i in range(0, num_pages, 2):
-        new_page = writer.add_blank_page(width=A4_LANDSCAPE_WIDTH, height=A4_LANDSCAPE_HEIGHT)
+def create_pdf_fitz(input_path: str, output_path: str, crop_settings: dict, x_offset: float, y_offset: float):
+    """
+    Same 2-up layout as create_pdf, but imposed with PyMuPDF's show_pdf_page.
+
+    The source pages are placed by reference to the already-parsed document,
+    so no content stream is rebuilt in Python. PyMuPDF uses a top-left origin,
+    so the vertical placement is mirrored relative to create_pdf. Links and
+    other annotations are not carried over.
 
-        # Process up to two pages for the new sheet
-        for page_index_in_pair in range(2):
+    Args:
+        input_path: Path to the source PDF file.
+        output_path: Path where the new PDF will be saved.
+        crop_settings: A dictionary with crop percentages for top, bottom, left, right.
+        x_offset: Manual horizontal shift in points.
+        y_offset: Manual vertical shift in points.
+    """
+    try:
+        import pymupdf
+    except ImportError:
+        print("Error: The 'fitz' backend requires PyMuPDF (pip install pymupdf).")
+        sys.exit(1)
+
+    try:
+        src = pymupdf.open(input_path)
+    except (FileNotFoundError, pymupdf.FileNotFoundError):
+        print(f"Error: The file '{input_path}' was not found.")
+        sys.exit(1)
+
+    dst = pymupdf.open()
+    num_pages = len(src)
+    print(f"Processing {num_pages} pages with custom crop settings...")
+    print(f"Crop settings: Top={crop_settings['top']}%, Bottom={crop_settings['bottom']}%, Left={crop_settings['left']}%, Right={crop_settings['right']}%")
+
+    # Crop percentages apply to the media box, as in create_pdf; page.rect would be the source's crop box.
+    # Widening the crop box to the media box (in memory only) also makes clip below a media box rectangle.
+    page_rects = []
+    for page in src:
+        page.set_cropbox(page.mediabox)
+        page_rects.append(page.rect)
+    layouts = compute_layouts([(rect.width, rect.height) for rect in page_rects], crop_settings, x_offset, y_offset)
+
+    for i in progress(range(0, num_pages, 2), "Sheets"):
+        new_page = dst.new_page(width=A4_LANDSCAPE_WIDTH, height=A4_LANDSCAPE_HEIGHT)
+
+        for page_index_in_pair, layout in enumerate(layouts[i:i + 2]):
             current_page_num = i + page_index_in_pair
-            if current_page_num >= num_pages:
-                continue
+            page_rect = page_rects[current_page_num]
+            crop_left, crop_bottom, crop_right_edge, crop_top_edge, scale, tx, ty = layout
 
-            page = reader.pages[current_page_num]
-            original_w = float(page.mediabox.width)
-            original_h = float(page.mediabox.height)
+            # PyMuPDF measures y downwards from the top edge, so flip the crop box and placement
+            clip = pymupdf.Rect(crop_left, page_rect.height - crop_top_edge, crop_right_edge, page_rect.height - crop_bottom)
+            scaled_w, scaled_h = clip.width * scale, clip.height * scale
+            # tx/ty place the page origin, as in create_pdf; show_pdf_page positions the clip itself
+            left = SHEET_ANCHORS[page_index_in_pair] + tx + crop_left * scale
+            top = A4_LANDSCAPE_HEIGHT - (ty + crop_bottom * scale) - scaled_h
 
-            # --- NEW: Per-Edge Cropping Logic ---
-            crop_top = original_h * (crop_settings['top'] / 100.0)
-            crop_bottom = original_h * (crop_settings['bottom'] / 100.0)
-            crop_left = original_w * (crop_settings['left'] / 100.0)
-            crop_right = original_w * (crop_settings['right'] / 100.0)
+            dest_rect = pymupdf.Rect(left, top, left + scaled_w, top + scaled_h)
+            new_page.show_pdf_page(dest_rect, src, pno=current_page_num, clip=clip)
 
-            # Set the page's cropBox to the new, smaller area.
-            page.cropbox.lower_left = (crop_left, crop_bottom)
-            page.cropbox.upper_right = (original_w - crop_right, original_h - crop_top)
+    try:
+        dst.save(output_path, garbage=1, deflate=True)
+        print(f"✅ Success! Created '{output_path}' with {len(dst)} pages.")
+    except Exception as e:
+        print(f"Error: Could not write to output file '{output_path}'.")
+        print(e)
+        sys.exit(1)
 
-            # Scale and place using cropped dimensions
-            cropped_w = float(page.cropbox.width)
-            cropped_h = float(page.cropbox.height)
-            scale = min(target_width_per_page / cropped_w, target_height_per_page / cropped_h)
-            scaled_w, scaled_h = cropped_w * scale, cropped_h * scale
+def create_pdf_pikepdf(input_path: str, output_path: str, crop_settings: dict, x_offset: float, y_offset: float):
+    """
+    Same 2-up layout as create_pdf, with pikepdf (QPDF) doing the parsing and
+    writing in C++.
 
-            # Calculate centered position + manual offset
-            ty = (target_height_per_page - scaled_h) / 2 + y_offset
-            
-            # Position left or right page
-            if page_index_in_pair == 0: # Left page
-                tx = (target_width_per_page - scaled_w) / 2 + x_offset
-            else: # Right page
-                tx = (A4_LANDSCAPE_WIDTH / 2) + (target_width_per_page - scaled_w) / 2 + x_offset
+    Each source page gets its crop and trim boxes and is overlaid into its
+    rectangle on the sheet; QPDF turns it into a Form XObject and computes the
+    matrix. Links and other annotations are not carried over.
 
-            transform = Transformation().scale(sx=scale, sy=scale).translate(tx=tx, ty=ty)
-            new_page.merge_transformed_page(page, transform)
+    Args:
+        input_path: Path to the source PDF file.
+        output_path: Path where the new PDF will be saved.
+        crop_settings: A dictionary with crop percentages for top, bottom, left, right.
+        x_offset: Manual horizontal shift in points.
+        y_offset: Manual vertical shift in points.
+    """
+    try:
+        import pikepdf
+    except ImportError:
+        print("Error: The 'pikepdf' backend requires pikepdf (pip install pikepdf).")
+        sys.exit(1)
 
     try:
-        with open(output_path, "wb") as f:
-            writer.write(f)
-        print(f"✅ Success! Created '{output_path}' with {len(writer.pages)} pages.")
+        src = pikepdf.open(input_path)
+    except FileNotFoundError:
+        print(f"Error: The file '{input_path}' was not found.")
+        sys.exit(1)
+
+    dst = pikepdf.Pdf.new()
+    num_pages = len(src.pages)
+    print(f"Processing {num_pages} pages with custom crop settings...")
+    print(f"Crop settings: Top={crop_settings['top']}%, Bottom={crop_settings['bottom']}%, Left={crop_settings['left']}%, Right={crop_settings['right']}%")
+
+    sizes = []
+    for page in src.pages:
+        mb = page.mediabox
+        sizes.append((float(mb[2]) - float(mb[0]), float(mb[3]) - float(mb[1])))
+    layouts = compute_layouts(sizes, crop_settings, x_offset, y_offset)
+
+    for i in progress(range(0, num_pages, 2), "Sheets"):
+        new_page = dst.add_blank_page(page_size=(A4_LANDSCAPE_WIDTH, A4_LANDSCAPE_HEIGHT))
+
+        for page_index_in_pair, layout in enumerate(layouts[i:i + 2]):
+            page = src.pages[i + page_index_in_pair]
+            crop_left, crop_bottom, crop_right_edge, crop_top_edge, scale, tx, ty = layout
+
+            # Only the in-memory source is modified; it is never saved. add_overlay clips to the trim box when the
+            # page has one, so it is cropped too
+            page.cropbox = page.trimbox = [crop_left, crop_bottom, crop_right_edge, crop_top_edge]
+            # tx/ty place the page origin, as in create_pdf; add_overlay positions the crop box itself
+            left = SHEET_ANCHORS[page_index_in_pair] + tx + crop_left * scale
+            bottom = ty + crop_bottom * scale
+            rect = pikepdf.Rectangle(left, bottom,
+                                     left + (crop_right_edge - crop_left) * scale, bottom + (crop_top_edge - crop_bottom) * scale)
+            new_page.add_overlay(page, rect)
+
+    try:
+        dst.save(output_path, object_stream_mode=pikepdf.ObjectStreamMode.generate)
+        print(f"✅ Success! Created '{output_path}' with {len(dst.pages)} pages.")
     except Exception as e:
         print(f"Error: Could not write to output file '{output_path}'.")
         print(e)
         sys.exit(1)
 
+def add_image_sheet(writer: PdfWriter, jpeg: bytes, size: tuple[int, int]):
+    """
+    Adds a sheet to writer showing one RGB JPEG of the given pixel size over
+    the whole page; the JPEG data is embedded as-is (DCTDecode).
+    """
+    new_page = writer.add_page(SHEET_TEMPLATE)
+    image = EncodedStreamObject()
+    image._data = jpeg
+    image.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Image"),
+        NameObject("/Width"): NumberObject(size[0]),
+        NameObject("/Height"): NumberObject(size[1]),
+        NameObject("/ColorSpace"): NameObject("/DeviceRGB"),
+        NameObject("/BitsPerComponent"): NumberObject(8),
+        NameObject("/Filter"): NameObject("/DCTDecode"),
+    })
+    new_page[NameObject("/Resources")] = DictionaryObject(
+        {NameObject("/XObject"): DictionaryObject({NameObject("/Im1"): writer._add_object(image)})})
+    content = DecodedStreamObject()
+    content.set_data(b"q %f 0 0 %f 0 0 cm /Im1 Do Q" % (A4_LANDSCAPE_WIDTH, A4_LANDSCAPE_HEIGHT))
+    new_page[NameObject("/Contents")] = writer._add_object(content)
+    return new_page
+
+def create_pdf_raster(input_path: str, output_path: str, crop_settings: dict, x_offset: float, y_offset: float, dpi: float):
+    """
+    Print-only fast path: renders each sheet to a JPEG with pypdfium2 (PDFium)
+    and streams the images into the output one sheet at a time.
+
+    Vector content, fonts and text are not kept, but no content stream is
+    parsed or rewritten in Python; for scanned or image-heavy inputs this is
+    usually the fastest option and often the smallest output.
+
+    Args:
+        input_path: Path to the source PDF file.
+        output_path: Path where the new PDF will be saved.
+        crop_settings: A dictionary with crop percentages for top, bottom, left, right.
+        x_offset: Manual horizontal shift in points.
+        y_offset: Manual vertical shift in points.
+        dpi: Resolution of the rendered sheets.
+    """
+    try:
+        import pypdfium2 as pdfium
+        from PIL import Image
+    except ImportError:
+        print("Error: --raster-dpi requires pypdfium2 and Pillow (pip install pypdfium2 pillow).")
+        sys.exit(1)
+
+    try:
+        pdf = pdfium.PdfDocument(input_path)
+    except FileNotFoundError:
+        print(f"Error: The file '{input_path}' was not found.")
+        sys.exit(1)
+
+    num_pages = len(pdf)
+    print(f"Processing {num_pages} pages with custom crop settings...")
+    print(f"Crop settings: Top={crop_settings['top']}%, Bottom={crop_settings['bottom']}%, Left={crop_settings['left']}%, Right={crop_settings['right']}%")
+
+    px_per_pt = dpi / 72
+    sheet_size = (round(A4_LANDSCAPE_WIDTH * px_per_pt), round(A4_LANDSCAPE_HEIGHT * px_per_pt))
+    # Crop percentages apply to the media box, as in create_pdf; get_size() and render(crop=...) go by the crop box,
+    # so each page's crop box is widened to its media box first (in memory only)
+    page_sizes_pt = []
+    for i in range(num_pages):
+        page = pdf[i]
+        page.set_cropbox(*page.get_mediabox())
+        page_sizes_pt.append(page.get_size())
+    layouts = compute_layouts(page_sizes_pt, crop_settings, x_offset, y_offset)
+
+    writer = new_sheet_writer()
+    try:
+        with partial_output(output_path) as f:
+            output = StreamingPdfWriter(writer, f)
+            for i in progress(range(0, num_pages, 2), "Sheets"):
+                sheet = Image.new("RGB", sheet_size, "white")
+
+                for page_index_in_pair, layout in enumerate(layouts[i:i + 2]):
+                    original_w, original_h = page_sizes_pt[i + page_index_in_pair]
+                    crop_left, crop_bottom, crop_right_edge, crop_top_edge, scale, tx, ty = layout
+
+                    # Render straight at the final size, so the crop is the only image operation left
+                    image = pdf[i + page_index_in_pair].render(
+                        scale=scale * px_per_pt,
+                        crop=(crop_left, crop_bottom, original_w - crop_right_edge, original_h - crop_top_edge),
+                    ).to_pil()
+
+                    # tx/ty place the page origin, as in create_pdf; PIL measures y downwards from the top edge
+                    left = SHEET_ANCHORS[page_index_in_pair] + tx + crop_left * scale
+                    top = A4_LANDSCAPE_HEIGHT - (ty + crop_bottom * scale) - (crop_top_edge - crop_bottom) * scale
+                    sheet.paste(image, (round(left * px_per_pt), round(top * px_per_pt)))
+
+                # Only the compressed sheet is written, and it leaves memory with the flush; the raw bitmap is tens
+                # of MB at print resolutions
+                buffer = io.BytesIO()
+                sheet.save(buffer, "JPEG", quality=RASTER_JPEG_QUALITY, dpi=(dpi, dpi))
+                add_image_sheet(writer, buffer.getvalue(), sheet_size)
+                output.flush()
+            output.close()
+        print(f"✅ Success! Created '{output_path}' with {len(writer.pages)} pages.")
+    except OSError as e:
+        print(f"Error: Could not write to output file '{output_path}'.")
+        print(e)
+        sys.exit(1)
+
+BACKENDS = {
+    'pypdf': create_pdf,
+    'fitz': create_pdf_fitz,
+    'pikepdf': create_pdf_pikepdf,
+}
+
 def main():
     parser = argparse.ArgumentParser(description="Professional PDF tool for 2-up conversion with per-edge margin control.")
     parser.add_argument("input_pdf", help="Source PDF file.")
@@ -92,6 +852,9 @@ def main():
     parser.add_argument("--crop_right", type=float, default=0.0, help="Percentage to crop from the right margin.")
     parser.add_argument("--x_offset", type=float, default=0.0, help="Horizontal shift in points (positive is right).")
     parser.add_argument("--y_offset", type=float, default=0.0, help="Vertical shift in points (positive is up).")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="pypdf", help="PDF engine used for the imposition (fitz requires PyMuPDF, pikepdf requires pikepdf).")
+    parser.add_argument("--compress", action="store_true", help="Deflate the output's uncompressed streams in one pass with pikepdf (pypdf backend only).")
+    parser.add_argument("--raster-dpi", type=float, default=None, help="Print-only fast path: rasterize the sheets at this DPI with pypdfium2 (overrides --backend).")
     
     args = parser.parse_args()
     
@@ -108,7 +871,19 @@ def main():
             print(f"Error: Crop percentage for '{edge}' must be between 0 and 49.")
             sys.exit(1)
             
-    create_pdf(args.input_pdf, args.output_pdf, crop_settings, args.x_offset, args.y_offset)
+    if args.compress and (args.backend != 'pypdf' or args.raster_dpi is not None):
+        print("Error: --compress only applies to the pypdf backend.")
+        sys.exit(1)
+
+    if args.raster_dpi is not None:
+        if args.raster_dpi <= 0:
+            print("Error: --raster-dpi must be positive.")
+            sys.exit(1)
+        create_pdf_raster(args.input_pdf, args.output_pdf, crop_settings, args.x_offset, args.y_offset, args.raster_dpi)
+        return
+
+    backend_options = {'compress': args.compress} if args.backend == 'pypdf' else {}
+    BACKENDS[args.backend](args.input_pdf, args.output_pdf, crop_settings, args.x_offset, args.y_offset, **backend_options)
 
 if __name__ == "__main__":
     main()